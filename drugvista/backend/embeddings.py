@@ -3,82 +3,115 @@ Document Embedding and Index Creation
 AWS Mapping: This would be a Lambda function triggered by S3 uploads
 """
 import os
-import glob
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+    import torch
+    # Physical cores with one interop pool (matches vector_store's tuning)
+    torch.set_num_interop_threads(1)
+    torch.set_num_threads(max(1, (os.cpu_count() or 2) // 2))
+except ImportError:
+    pass
+except RuntimeError:
+    pass  # thread pools already started
+
 from vector_store import VectorStore
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Data subfolder -> document type mapping
+DOC_TYPES = {
+    "papers": "paper",
+    "clinical_trials": "clinical_trial",
+    "market": "market",
+}
+
+
+def _read_text(path: str) -> str:
+    """Read a document with a large buffer so most files arrive in one read"""
+    with open(path, 'r', encoding='utf-8', errors='replace', buffering=1 << 20) as f:
+        return f.read()
+
+
 def load_documents_from_data_folder():
     """
     Load all documents from the data folder
     AWS Mapping: This would read from S3 buckets
     """
-    documents = []
     data_path = "../data"
-    
-    # Load papers
-    papers_path = os.path.join(data_path, "papers", "*.txt")
-    for file_path in glob.glob(papers_path):
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            documents.append({
-                'filename': os.path.basename(file_path),
-                'type': 'paper',
-                'content': content,
-                'source_path': file_path
-            })
-        except Exception as e:
-            logger.error(f"Failed to load {file_path}: {e}")
-    
-    # Load clinical trials
-    trials_path = os.path.join(data_path, "clinical_trials", "*.txt")
-    for file_path in glob.glob(trials_path):
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            documents.append({
-                'filename': os.path.basename(file_path),
-                'type': 'clinical_trial',
-                'content': content,
-                'source_path': file_path
-            })
-        except Exception as e:
-            logger.error(f"Failed to load {file_path}: {e}")
-    
-    # Load market intelligence
-    market_path = os.path.join(data_path, "market", "*.txt")
-    for file_path in glob.glob(market_path):
+
+    # Collect (name, type, path) for every document first...
+    entries = []
+    for subfolder, doc_type in DOC_TYPES.items():
+        folder = os.path.join(data_path, subfolder)
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            documents.append({
-                'filename': os.path.basename(file_path),
-                'type': 'market',
-                'content': content,
-                'source_path': file_path
-            })
-        except Exception as e:
-            logger.error(f"Failed to load {file_path}: {e}")
-    
+            with os.scandir(folder) as it:
+                for entry in it:
+                    if entry.name.endswith('.txt') and entry.is_file():
+                        entries.append((entry.name, doc_type, entry.path))
+        except FileNotFoundError:
+            logger.warning(f"Data folder not found: {folder}")
+
+    # ...then read them concurrently; the GIL is released during file I/O
+    documents = []
+    max_workers = min(32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_read_text, path): (name, doc_type, path)
+            for name, doc_type, path in entries
+        }
+        for future in as_completed(futures):
+            name, doc_type, path = futures[future]
+            try:
+                documents.append({
+                    'filename': name,
+                    'type': doc_type,
+                    'content': future.result(),
+                    'source_path': path
+                })
+            except Exception as e:
+                logger.error(f"Failed to load {path}: {e}")
+
     logger.info(f"Loaded {len(documents)} documents")
     return documents
 
-def create_vector_index():
+def _index_is_current(vector_store) -> bool:
+    """True when the saved index is newer than every source document"""
+    try:
+        index_mtime = os.stat(vector_store.index_path).st_mtime_ns
+        os.stat(vector_store.metadata_path)
+    except OSError:
+        return False
+
+    for subfolder in DOC_TYPES:
+        folder = os.path.join("../data", subfolder)
+        try:
+            with os.scandir(folder) as it:
+                for entry in it:
+                    if entry.name.endswith('.txt') and entry.stat().st_mtime_ns >= index_mtime:
+                        return False
+        except FileNotFoundError:
+            pass
+    return True
+
+def create_vector_index(force: bool = False):
     """
-    Create vector index from documents
+    Create vector index from documents. The expensive embedding pass runs
+    at build time so the backend and tests only ever mmap the saved index;
+    an up-to-date index (newer than every data file) is not rebuilt.
     AWS Mapping: Lambda function for batch processing
     """
-    logger.info("Starting vector index creation")
-    
     # Initialize vector store
     vector_store = VectorStore()
-    
+
+    if not force and vector_store.get_stats()['total_documents'] and _index_is_current(vector_store):
+        logger.info("Vector index is up to date, skipping rebuild (use force=True to override)")
+        return True
+
+    logger.info("Starting vector index creation")
+
     # Load documents
     documents = load_documents_from_data_folder()
     
@@ -119,7 +152,7 @@ def test_search():
         results = vector_store.search(query, top_k=3)
         logger.info(f"Query: '{query}' -> {len(results)} results")
         for i, result in enumerate(results):
-            logger.info(f"  {i+1}. {result['filename']} (score: {result['similarity_score']:.3f})")
+            logger.info(f"  {i+1}. {result.filename} (score: {result.score:.3f})")
 
 if __name__ == "__main__":
     # Create vector index
@@ -0,0 +1,121 @@
+"""
+Keyword Category Scanning
+AWS Mapping: Comprehend custom entity detection would replace this locally
+"""
+import re
+import string
+
+# ASCII-only lowercase table: one branchless C pass over the text, enough
+# for the ASCII keyword tables (non-ASCII characters pass through untouched)
+_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def fold(text: str) -> str:
+    """ASCII-lowercase text via the translate LUT"""
+    return text.translate(_LOWER)
+
+
+class KeywordScanner:
+    """
+    Find which keyword categories appear in a text in a single pass.
+
+    With pyahocorasick installed, every keyword across all categories is
+    compiled into one automaton, so a scan reads the text once instead of
+    once per keyword. Without it, the text is tokenized once and each
+    category is tested by frozenset intersection; multi-word phrases keep
+    a substring check. Callers pass lowercased text.
+    """
+
+    _word_re = re.compile(r'[a-z]+')
+
+    def __init__(self, categories: dict):
+        self.categories = dict(categories)
+        self._words = {
+            category: frozenset(word for word in words if ' ' not in word)
+            for category, words in self.categories.items()
+        }
+        self._phrases = {
+            category: tuple(word for word in words if ' ' in word)
+            for category, words in self.categories.items()
+        }
+        self._automaton = self._build_automaton()
+
+        # Stable bit assignment (table order) for packed per-document flags
+        self.bits = {category: 1 << i for i, category in enumerate(self.categories)}
+
+    def _build_automaton(self):
+        """Compile all keywords into one Aho-Corasick automaton (optional dep)"""
+        try:
+            import ahocorasick
+        except ImportError:
+            return None
+        # A keyword may belong to several categories, so each automaton entry
+        # carries the full tuple of categories it should flag
+        word_categories = {}
+        for category, words in self.categories.items():
+            for word in words:
+                word_categories.setdefault(word, []).append(category)
+        automaton = ahocorasick.Automaton()
+        for word, cats in word_categories.items():
+            automaton.add_word(word, tuple(cats))
+        automaton.make_automaton()
+        return automaton
+
+    def scan(self, text: str) -> set:
+        """Return the set of categories whose keywords occur in text"""
+        if self._automaton is not None:
+            return {
+                category
+                for _, categories in self._automaton.iter(text)
+                for category in categories
+            }
+        words = frozenset(self._word_re.findall(text))
+        return {
+            category for category in self.categories
+            if words & self._words[category]
+            or any(phrase in text for phrase in self._phrases[category])
+        }
+
+    def bitmask(self, text: str) -> int:
+        """Pack scan(text) into an integer bitmask (bit order = table order)"""
+        mask = 0
+        for category in self.scan(text):
+            mask |= self.bits[category]
+        return mask
+
+    def categories_from(self, mask: int) -> set:
+        """Decode a bitmask (or an OR of bitmasks) back into category names"""
+        return {category for category, bit in self.bits.items() if mask & bit}
+
+    def scan_many(self, texts) -> set:
+        """
+        Union of categories across several texts. Scanning per document
+        avoids concatenating megabytes of content into one throwaway string,
+        and stops early once every category has been seen.
+        """
+        hits = set()
+        total = len(self.categories)
+        for text in texts:
+            hits |= self.scan(text)
+            if len(hits) == total:
+                break
+        return hits
+
+
+# Canonical category table shared by the pipeline scan, the demo and the
+# ingest-time document bitsets, so no consumer can drift from the others.
+# Inflections are listed explicitly because word-mode matching no longer
+# catches them as substrings the way the old 'fail' in text checks did.
+ANALYSIS_KEYWORDS = {
+    'viability_pos': ('promising', 'effective', 'successful', 'approved'),
+    'viability_neg': ('failed', 'ineffective', 'toxic', 'toxicity', 'discontinued'),
+    'risk_toxicity': ('toxicity', 'toxic'),
+    'risk_side_effect': ('side effect', 'adverse'),
+    'risk_trial': ('trial', 'trials'),
+    'risk_fail': ('fail', 'fails', 'failed', 'failing', 'failure', 'failures'),
+    'risk_bleeding': ('bleeding',),
+    'market_strong': ('strong', 'stronger', 'growing', 'demand', 'demands', 'billion'),
+    'market_weak': ('weak', 'weaker', 'declining', 'saturated'),
+}
+
+ANALYSIS_SCANNER = KeywordScanner(ANALYSIS_KEYWORDS)
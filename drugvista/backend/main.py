@@ -2,28 +2,96 @@
 FastAPI Backend for DRUGVISTA
 AWS Mapping: This would be deployed as Lambda + API Gateway
 """
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from rag_pipeline import RAGPipeline
 from typing import Optional
+import asyncio
+import hashlib
 import logging
 import os
 import csv
 import json
+import sqlite3
+import tempfile
+import time
+import uuid
 from io import StringIO, BytesIO
 
+# orjson is optional: 2-3x faster JSON parsing and response serialization.
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so the existing
+# except branches keep working either way.
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse as _ResponseClass
+except ImportError:
+    orjson = None
+    from fastapi.responses import JSONResponse as _ResponseClass
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="DRUGVISTA API")
+app = FastAPI(title="DRUGVISTA API", default_response_class=_ResponseClass)
 
 # Supported file types
 ALLOWED_EXTENSIONS = {'.txt', '.csv', '.json', '.pdf', '.docx'}
 
+# Content-hash cache so re-uploading identical bytes skips parsing + embedding
+# AWS Mapping: this would be a DynamoDB table keyed on the S3 object checksum
+INGEST_CACHE_PATH = os.getenv("INGEST_CACHE_PATH", "ingest_cache.db")
+INGEST_CACHE_TTL = int(os.getenv("INGEST_CACHE_TTL", "86400"))
+
+
+def _ingest_cache() -> sqlite3.Connection:
+    conn = sqlite3.connect(INGEST_CACHE_PATH)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS ingest_cache "
+        "(hash TEXT PRIMARY KEY, filename TEXT, documents_added INTEGER, ts REAL)"
+    )
+    return conn
+
+
+def check_ingest_cache(content_hash: str):
+    """Return the cached documents_added count for this upload, or None"""
+    try:
+        with _ingest_cache() as conn:
+            row = conn.execute(
+                "SELECT documents_added, ts FROM ingest_cache WHERE hash=?",
+                (content_hash,)
+            ).fetchone()
+        if row and time.time() - row[1] < INGEST_CACHE_TTL:
+            return row[0]
+    except Exception as e:
+        logger.warning(f"Ingest cache lookup failed: {e}")
+    return None
+
+
+def record_ingest_cache(content_hash: str, filename: str, documents_added: int):
+    """Record a successful ingest so identical uploads can short-circuit"""
+    try:
+        with _ingest_cache() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO ingest_cache VALUES (?, ?, ?, ?)",
+                (content_hash, filename, documents_added, time.time())
+            )
+    except Exception as e:
+        logger.warning(f"Ingest cache update failed: {e}")
+
 
 def extract_pdf_text(content: bytes) -> str:
     """Extract text from PDF file"""
+    # Prefer pymupdf (MuPDF C library): much faster than PyPDF2 on large
+    # PDFs and it releases the GIL during extraction
+    try:
+        import pymupdf
+        with pymupdf.open(stream=content, filetype="pdf") as doc:
+            return "\n".join(page.get_text() for page in doc)
+    except ImportError:
+        pass
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to parse PDF: {str(e)}")
+
     try:
         import PyPDF2
         pdf_reader = PyPDF2.PdfReader(BytesIO(content))
@@ -32,7 +100,7 @@ def extract_pdf_text(content: bytes) -> str:
             text_parts.append(page.extract_text() or "")
         return "\n".join(text_parts)
     except ImportError:
-        raise HTTPException(status_code=500, detail="PyPDF2 not installed. Run: pip install PyPDF2")
+        raise HTTPException(status_code=500, detail="No PDF parser installed. Run: pip install pymupdf")
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to parse PDF: {str(e)}")
 
@@ -66,6 +134,29 @@ except Exception as e:
     logger.error(f"Failed to initialize RAG: {e}")
     rag = None
 
+# Debounce interval for persisting the vector index after ingests
+SAVE_DEBOUNCE_MS = int(os.getenv("SAVE_DEBOUNCE_MS", "5000"))
+
+
+async def _save_flush_loop():
+    """Periodically persist the index when ingests have dirtied it"""
+    while True:
+        await asyncio.sleep(SAVE_DEBOUNCE_MS / 1000)
+        if rag:
+            rag.vector_store.flush_if_dirty()
+
+
+@app.on_event("startup")
+async def start_save_flusher():
+    asyncio.create_task(_save_flush_loop())
+
+
+@app.on_event("shutdown")
+def flush_index_on_shutdown():
+    if rag:
+        rag.vector_store.flush_if_dirty()
+
+
 class AnalysisRequest(BaseModel):
     query: str
 
@@ -107,7 +198,7 @@ async def analyze(request: AnalysisRequest):
     
     try:
         logger.info(f"Processing query: {request.query[:100]}")
-        result = rag.analyze(request.query)
+        result = await rag.analyze(request.query)
         logger.info("Analysis completed successfully")
         return result
     except Exception as e:
@@ -115,14 +206,192 @@ async def analyze(request: AnalysisRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+class BatchAnalysisRequest(BaseModel):
+    queries: list[str]
+
+
+@app.post("/analyze_batch", response_model=list[AnalysisResponse])
+async def analyze_batch(request: BatchAnalysisRequest):
+    """
+    Analyze several queries in one request: one batched embedding forward
+    pass and one FAISS search cover every cache miss, and the per-query
+    LLM calls run concurrently
+    """
+    if not rag:
+        raise HTTPException(status_code=503, detail="RAG pipeline not initialized")
+
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="No queries supplied")
+    if any(not q or len(q.strip()) < 3 for q in request.queries):
+        raise HTTPException(status_code=400, detail="Query too short")
+
+    try:
+        logger.info(f"Processing batch of {len(request.queries)} queries")
+        return await rag.analyze_batch(request.queries)
+    except Exception as e:
+        logger.error(f"Batch analysis failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 class IngestResponse(BaseModel):
     success: bool
     message: str
     documents_added: int
+    job_id: Optional[str] = None
+
+
+# Uploads larger than this are processed in the background
+LARGE_UPLOAD_BYTES = int(os.getenv("LARGE_UPLOAD_BYTES", str(8 * 1024 * 1024)))
+
+# In-memory job registry for background ingests
+# AWS Mapping: SQS queue + DynamoDB job table
+ingest_jobs = {}
+
+
+def _iter_csv_rows(lines, filename: str, doc_type: str, description: Optional[str]):
+    """Yield one document per CSV row from any text-file-like source"""
+    reader = csv.DictReader(lines)
+    for i, row in enumerate(reader):
+        # Convert row to readable text
+        row_text = "\n".join([f"{k}: {v}" for k, v in row.items() if v])
+        if len(row_text.strip()) >= 10:
+            yield {
+                'content': row_text,
+                'filename': f"{filename}_row_{i+1}",
+                'type': doc_type,
+                'description': description or f"CSV row {i+1} from {filename}"
+            }
+
+
+def iter_rows(text_content: str, file_ext: str, filename: str,
+              doc_type: str, description: Optional[str]):
+    """Yield documents from parsed text one at a time (CSV rows / JSON items)"""
+    if file_ext == '.csv':
+        # Parse CSV - each row becomes a document
+        yield from _iter_csv_rows(StringIO(text_content), filename, doc_type, description)
+
+    elif file_ext == '.json':
+        # Parse JSON - handle array of records or single object
+        data = orjson.loads(text_content) if orjson else json.loads(text_content)
+
+        if isinstance(data, list):
+            # Array of records
+            for i, item in enumerate(data):
+                if isinstance(item, dict):
+                    item_text = "\n".join([f"{k}: {v}" for k, v in item.items()])
+                else:
+                    item_text = str(item)
+
+                if len(item_text.strip()) >= 10:
+                    yield {
+                        'content': item_text,
+                        'filename': f"{filename}_item_{i+1}",
+                        'type': doc_type,
+                        'description': description or f"JSON item {i+1} from {filename}"
+                    }
+        else:
+            # Single object
+            item_text = "\n".join([f"{k}: {v}" for k, v in data.items()])
+            yield {
+                'content': item_text,
+                'filename': filename,
+                'type': doc_type,
+                'description': description or f"User uploaded: {filename}"
+            }
+
+    else:
+        # Plain text file - single document
+        yield {
+            'content': text_content,
+            'filename': filename,
+            'type': doc_type,
+            'description': description or f"User uploaded: {filename}"
+        }
+
+
+def parse_documents(content: bytes, file_ext: str, filename: str,
+                    doc_type: str, description: Optional[str]):
+    """Parse an uploaded file into a stream of documents for the vector store"""
+    if file_ext == '.pdf':
+        text_content = extract_pdf_text(content)
+    elif file_ext == '.docx':
+        text_content = extract_docx_text(content)
+    else:
+        text_content = content.decode('utf-8')
+
+    if len(text_content.strip()) < 10:
+        raise HTTPException(status_code=400, detail="File content too short")
+
+    return iter_rows(text_content, file_ext, filename, doc_type, description)
+
+
+def parse_documents_from_path(tmp_path: str, file_ext: str, filename: str,
+                              doc_type: str, description: Optional[str]):
+    """
+    Parse a spooled upload straight from its temp file. CSV rows stream off
+    disk (peak memory stays O(row)) and pymupdf reads the PDF path directly;
+    JSON and plain text inherently need the full decoded text.
+    """
+    if file_ext == '.csv':
+        def stream():
+            with open(tmp_path, newline='', encoding='utf-8') as f:
+                yield from _iter_csv_rows(f, filename, doc_type, description)
+        return stream()
+
+    if file_ext == '.pdf':
+        try:
+            import pymupdf
+            with pymupdf.open(tmp_path) as doc:
+                text_content = "\n".join(page.get_text() for page in doc)
+        except ImportError:
+            with open(tmp_path, 'rb') as f:
+                text_content = extract_pdf_text(f.read())
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Failed to parse PDF: {str(e)}")
+    elif file_ext == '.docx':
+        with open(tmp_path, 'rb') as f:
+            text_content = extract_docx_text(f.read())
+    else:
+        with open(tmp_path, encoding='utf-8') as f:
+            text_content = f.read()
+
+    if len(text_content.strip()) < 10:
+        raise HTTPException(status_code=400, detail="File content too short")
+
+    return iter_rows(text_content, file_ext, filename, doc_type, description)
+
+
+def process_upload(job_id: str, tmp_path: str, file_ext: str, filename: str,
+                   doc_type: str, description: Optional[str], content_hash: str):
+    """Background worker: parse, embed and index a queued upload"""
+    ingest_jobs[job_id] = {"status": "processing", "documents_added": 0}
+    try:
+        documents = parse_documents_from_path(tmp_path, file_ext, filename,
+                                              doc_type, description)
+        added = rag.vector_store.add_documents(documents)
+        if not added:
+            raise ValueError("No valid content found in file")
+
+        rag.vector_store.mark_dirty()
+        rag.clear_cache()
+        record_ingest_cache(content_hash, filename, added)
+
+        ingest_jobs[job_id] = {"status": "done", "documents_added": added}
+        logger.info(f"Background ingest {job_id} added {added} documents")
+    except Exception as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        logger.error(f"Background ingest {job_id} failed: {detail}")
+        ingest_jobs[job_id] = {"status": "failed", "documents_added": 0, "error": detail}
+    finally:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
 
 
 @app.post("/ingest", response_model=IngestResponse)
 async def ingest_document(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     doc_type: str = Form(default="patient_data"),
     description: Optional[str] = Form(default=None)
@@ -143,87 +412,78 @@ async def ingest_document(
         )
     
     try:
-        # Read file content
+        # Large uploads (by declared size): stream to a temp file in 1 MB
+        # chunks, hashing as we go, then parse + embed in the background so
+        # the HTTP connection is not held open through indexing. The
+        # background parse also reads from the temp file (streamed for CSV,
+        # path-based for PDF), so the raw payload is never held in memory
+        if file.size and file.size > LARGE_UPLOAD_BYTES:
+            hasher = hashlib.sha256()
+            tmp = tempfile.NamedTemporaryFile(delete=False, suffix=file_ext)
+            try:
+                while chunk := await file.read(1 << 20):
+                    hasher.update(chunk)
+                    tmp.write(chunk)
+            finally:
+                tmp.close()
+            content_hash = hasher.hexdigest()
+
+            # Identical bytes were already ingested: skip parsing and embedding
+            cached_count = check_ingest_cache(content_hash)
+            if cached_count is not None:
+                os.unlink(tmp.name)
+                logger.info(f"Ingest cache hit for {file.filename}")
+                return IngestResponse(
+                    success=True,
+                    message=f"File already ingested ({cached_count} record(s) from {file.filename})",
+                    documents_added=cached_count
+                )
+
+            job_id = uuid.uuid4().hex
+            ingest_jobs[job_id] = {"status": "queued", "documents_added": 0}
+            background_tasks.add_task(
+                process_upload, job_id, tmp.name, file_ext,
+                file.filename, doc_type, description, content_hash
+            )
+            logger.info(f"Queued background ingest {job_id} for {file.filename}")
+            return IngestResponse(
+                success=True,
+                message=f"Upload queued for background indexing ({file.filename})",
+                documents_added=0,
+                job_id=job_id
+            )
+
+        # Small uploads: read fully and process inline
         content = await file.read()
-        
-        # Handle different file types
-        if file_ext == '.pdf':
-            text_content = extract_pdf_text(content)
-        elif file_ext == '.docx':
-            text_content = extract_docx_text(content)
-        else:
-            text_content = content.decode('utf-8')
-        
-        if len(text_content.strip()) < 10:
-            raise HTTPException(status_code=400, detail="File content too short")
-        
-        documents = []
-        
-        if file_ext == '.csv':
-            # Parse CSV - each row becomes a document
-            reader = csv.DictReader(StringIO(text_content))
-            for i, row in enumerate(reader):
-                # Convert row to readable text
-                row_text = "\n".join([f"{k}: {v}" for k, v in row.items() if v])
-                if len(row_text.strip()) >= 10:
-                    documents.append({
-                        'content': row_text,
-                        'filename': f"{file.filename}_row_{i+1}",
-                        'type': doc_type,
-                        'description': description or f"CSV row {i+1} from {file.filename}"
-                    })
-        
-        elif file_ext == '.json':
-            # Parse JSON - handle array of records or single object
-            data = json.loads(text_content)
-            
-            if isinstance(data, list):
-                # Array of records
-                for i, item in enumerate(data):
-                    if isinstance(item, dict):
-                        item_text = "\n".join([f"{k}: {v}" for k, v in item.items()])
-                    else:
-                        item_text = str(item)
-                    
-                    if len(item_text.strip()) >= 10:
-                        documents.append({
-                            'content': item_text,
-                            'filename': f"{file.filename}_item_{i+1}",
-                            'type': doc_type,
-                            'description': description or f"JSON item {i+1} from {file.filename}"
-                        })
-            else:
-                # Single object
-                item_text = "\n".join([f"{k}: {v}" for k, v in data.items()])
-                documents.append({
-                    'content': item_text,
-                    'filename': file.filename,
-                    'type': doc_type,
-                    'description': description or f"User uploaded: {file.filename}"
-                })
-        
-        else:
-            # Plain text file - single document
-            documents.append({
-                'content': text_content,
-                'filename': file.filename,
-                'type': doc_type,
-                'description': description or f"User uploaded: {file.filename}"
-            })
-        
-        if not documents:
+
+        # Identical bytes were already ingested: skip parsing and embedding
+        content_hash = hashlib.sha256(content).hexdigest()
+        cached_count = check_ingest_cache(content_hash)
+        if cached_count is not None:
+            logger.info(f"Ingest cache hit for {file.filename}")
+            return IngestResponse(
+                success=True,
+                message=f"File already ingested ({cached_count} record(s) from {file.filename})",
+                documents_added=cached_count
+            )
+
+        documents = parse_documents(content, file_ext, file.filename, doc_type, description)
+
+        # Stream rows straight into the vector store in embed-sized batches
+        added = rag.vector_store.add_documents(documents)
+        if not added:
             raise HTTPException(status_code=400, detail="No valid content found in file")
-        
-        # Add to vector store
-        rag.vector_store.add_documents(documents)
-        rag.vector_store.save_index()
-        
-        logger.info(f"Ingested {len(documents)} documents from: {file.filename}")
-        
+
+        rag.vector_store.mark_dirty()
+        rag.clear_cache()
+
+        record_ingest_cache(content_hash, file.filename, added)
+        logger.info(f"Ingested {added} documents from: {file.filename}")
+
         return IngestResponse(
             success=True,
-            message=f"Successfully ingested {len(documents)} record(s) from {file.filename}",
-            documents_added=len(documents)
+            message=f"Successfully ingested {added} record(s) from {file.filename}",
+            documents_added=added
         )
         
     except json.JSONDecodeError:
@@ -235,6 +495,15 @@ async def ingest_document(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/ingest/status/{job_id}")
+def ingest_status(job_id: str):
+    """Check the status of a background ingest job"""
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id")
+    return {"job_id": job_id, **job}
+
+
 class TextIngestRequest(BaseModel):
     content: str
     doc_type: str = "patient_data"
@@ -261,7 +530,8 @@ async def ingest_text(request: TextIngestRequest):
         }
         
         rag.vector_store.add_documents([document])
-        rag.vector_store.save_index()
+        rag.vector_store.mark_dirty()
+        rag.clear_cache()
         
         logger.info(f"Ingested text: {request.title or 'user input'}")
         
@@ -0,0 +1,86 @@
+"""
+ONNX Runtime Embedding Encoder
+AWS Mapping: SageMaker endpoint with an optimized inference container
+"""
+import glob
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Anchored to this module like the other store paths, so the exported model
+# is found no matter which directory the process was launched from
+_DEFAULT_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "onnx_model")
+
+
+class OnnxEncoder:
+    """
+    Drop-in replacement for SentenceTransformer's encode() using ONNX Runtime.
+
+    Exporting the transformer to ONNX lets the runtime fuse attention/layernorm
+    kernels, which is several times faster than the PyTorch path for the small
+    encode batches used at query time.
+    """
+
+    def __init__(self, model_name: str):
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+        import onnxruntime
+
+        session_options = onnxruntime.SessionOptions()
+        session_options.graph_optimization_level = \
+            onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        providers = ["CUDAExecutionProvider", "CPUExecutionProvider"]
+
+        # Prefer a pre-exported INT8 model (scripts/export_onnx.py): INT8 GEMM
+        # moves 4x fewer weight bytes and uses VNNI instructions where available
+        model_dir = os.getenv("ONNX_MODEL_DIR", _DEFAULT_MODEL_DIR)
+        quantized = sorted(glob.glob(os.path.join(model_dir, "*quantized*.onnx")))
+        if quantized:
+            self.model = ORTModelForFeatureExtraction.from_pretrained(
+                model_dir,
+                file_name=os.path.basename(quantized[-1]),
+                session_options=session_options,
+                providers=providers
+            )
+            self.tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=True)
+            logger.info(f"ONNX encoder using INT8 model from {model_dir}")
+            return
+
+        # Fall back to exporting the FP32 model on the fly
+        hf_name = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            hf_name,
+            export=True,
+            session_options=session_options,
+            providers=providers
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(hf_name, use_fast=True)
+        logger.info(f"ONNX encoder ready for {hf_name}")
+
+    def encode(self, texts, batch_size: int = 64, convert_to_numpy: bool = True,
+               normalize_embeddings: bool = True, **kwargs):
+        """Encode texts to mean-pooled (optionally L2-normalized) embeddings"""
+        embeddings = []
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            # max_length=256 caps the quadratic attention cost; MiniLM was
+            # trained at this length and the corpus chunks rarely exceed it
+            inputs = self.tokenizer(batch, padding=True, truncation=True,
+                                    max_length=256, return_tensors="np")
+            outputs = self.model(**inputs)
+            last_hidden = np.asarray(outputs.last_hidden_state, dtype=np.float32)
+
+            # Mean-pool over real tokens only; einsum contracts the mask in
+            # one BLAS pass without materializing the masked hidden states
+            mask = inputs["attention_mask"].astype(np.float32)
+            pooled = np.einsum('bsd,bs->bd', last_hidden, mask)
+            pooled /= np.maximum(mask.sum(axis=1, keepdims=True), 1e-9)
+            embeddings.append(pooled)
+
+        embeddings = np.concatenate(embeddings, axis=0)
+        if normalize_embeddings:
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings
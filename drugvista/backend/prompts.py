@@ -2,10 +2,36 @@
 Prompt Templates for Multi-step Reasoning
 Each prompt is designed for specific reasoning steps
 """
+from string import Formatter
+
+
+class CompiledTemplate:
+    """
+    Prompt template whose format spec is parsed once at import time.
+    str.format re-parses the template on every call; here rendering is just
+    interleaving precomputed literal segments with the field values.
+    """
+    __slots__ = ('raw', '_parts')
+
+    def __init__(self, raw: str):
+        self.raw = raw
+        self._parts = [(literal, field) for literal, field, _, _ in Formatter().parse(raw)]
+
+    def format(self, **kwargs) -> str:
+        pieces = []
+        for literal, field in self._parts:
+            pieces.append(literal)
+            if field is not None:
+                pieces.append(str(kwargs[field]))
+        return ''.join(pieces)
+
+    def __str__(self) -> str:
+        return self.raw
+
 
 class PromptTemplates:
-    
-    context_analysis = """
+
+    context_analysis = CompiledTemplate("""
 You are a biomedical AI analyzing a query about drugs, diseases, or molecules.
 
 QUERY: {query}
@@ -22,9 +48,9 @@ Provide a clear, factual analysis focusing on what can be determined from the re
 Avoid speculation. If information is missing, state that clearly.
 
 ANALYSIS:
-"""
+""")
 
-    clinical_analysis = """
+    clinical_analysis = CompiledTemplate("""
 You are a clinical research expert analyzing biomedical evidence.
 
 QUERY: {query}
@@ -43,9 +69,9 @@ Be precise and cite specific evidence. Do not hallucinate information not presen
 If evidence is insufficient, state that clearly.
 
 CLINICAL ANALYSIS:
-"""
+""")
 
-    market_analysis = """
+    market_analysis = CompiledTemplate("""
 You are a pharmaceutical market analyst reviewing market intelligence.
 
 QUERY: {query}
@@ -64,9 +90,39 @@ Base your analysis strictly on the provided market intelligence documents.
 Do not speculate beyond what is explicitly stated.
 
 MARKET ANALYSIS:
-"""
+""")
+
+    combined_analysis = CompiledTemplate("""
+You are a biomedical AI performing a full drug-development assessment in one pass.
+
+QUERY: {query}
+
+RETRIEVED CONTEXT:
+{retrieved_context}
+
+CLINICAL EVIDENCE:
+{clinical_evidence}
+
+MARKET INTELLIGENCE:
+{market_intelligence}
+
+TASK: Produce four analyses in a single JSON object with exactly these keys:
+1. "context": What type of analysis is needed, key entities (drugs, diseases,
+   targets), and the user's likely intent. Base this only on the retrieved context.
+2. "clinical": Clinical viability, risks or safety concerns, trial results, and
+   mechanism of action - based ONLY on the clinical evidence provided.
+3. "market": Demand signals, competitive landscape, regulatory status, and
+   commercial viability - based strictly on the market intelligence provided.
+4. "synthesis": A final recommendation weighing clinical evidence against market
+   factors, with the overall risk-benefit profile and clear reasoning.
+
+Be precise and cite specific evidence. Do not hallucinate information not present
+in the documents. If evidence is insufficient for a section, state that clearly.
+
+Respond with valid JSON only.
+""")
 
-    decision_synthesis = """
+    decision_synthesis = CompiledTemplate("""
 You are a pharmaceutical decision-making AI synthesizing multiple analyses.
 
 QUERY: {query}
@@ -90,4 +146,4 @@ Your synthesis should be balanced, evidence-based, and acknowledge limitations.
 Focus on actionable insights for pharmaceutical decision-makers.
 
 DECISION SYNTHESIS:
-"""
\ No newline at end of file
+""")
@@ -2,11 +2,16 @@
 RAG Pipeline with Multi-step Reasoning
 AWS Mapping: Orchestrates Bedrock (LLM) + SageMaker (embeddings) + S3 (documents)
 """
+import asyncio
+import io
 import json
 import logging
+import numpy as np
+from collections import OrderedDict
 from typing import Dict, List
 from vector_store import VectorStore
 from prompts import PromptTemplates
+from keywords import ANALYSIS_SCANNER, fold
 import openai
 import os
 from dotenv import load_dotenv
@@ -16,11 +21,19 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Completed analyses kept per normalized query (cleared on every ingest)
+ANALYZE_CACHE_SIZE = int(os.getenv("ANALYZE_CACHE_SIZE", "1024"))
+
+# The canonical keyword table lives in keywords.py so this scan and the
+# ingest-time document bitsets can never drift apart
+scan_categories = ANALYSIS_SCANNER.scan
+
+
 class RAGPipeline:
     def __init__(self):
         """Initialize RAG pipeline components"""
         # AWS Bedrock would replace OpenAI client
-        self.client = openai.OpenAI(
+        self.client = openai.AsyncOpenAI(
             api_key=os.getenv("OPENAI_API_KEY", "dummy-key-for-demo"),
             base_url=os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
         )
@@ -28,28 +41,92 @@ class RAGPipeline:
         # Load vector store (AWS: S3 + SageMaker embeddings)
         self.vector_store = VectorStore()
         self.prompts = PromptTemplates()
-        
+
+        # LRU of completed analyses keyed by normalized query
+        self._analysis_cache = OrderedDict()
+
         logger.info("RAG Pipeline initialized")
-    
-    def analyze(self, query: str) -> Dict:
+
+    def clear_cache(self):
+        """Drop cached analyses; called whenever new documents are ingested"""
+        self._analysis_cache.clear()
+
+    async def analyze(self, query: str) -> Dict:
+        """
+        Main analysis pipeline with multi-step reasoning.
+        Repeated queries are answered from an LRU cache, skipping the
+        embedding, FAISS search and LLM call entirely.
+        """
+        cache_key = query.strip().lower()
+        cached = self._analysis_cache.get(cache_key)
+        if cached is not None:
+            self._analysis_cache.move_to_end(cache_key)
+            logger.info("Analysis cache hit")
+            return cached
+
+        result = await self._analyze_uncached(query)
+        self._cache_result(cache_key, result)
+        return result
+
+    def _cache_result(self, cache_key: str, result: Dict):
+        """Cache a completed analysis (error fallbacks are never pinned)"""
+        if result.get('confidence_score', 0) > 0:
+            self._analysis_cache[cache_key] = result
+            if len(self._analysis_cache) > ANALYZE_CACHE_SIZE:
+                self._analysis_cache.popitem(last=False)
+
+    async def analyze_batch(self, queries: List[str]) -> List[Dict]:
         """
-        Main analysis pipeline with multi-step reasoning
+        Analyze several queries in one call. Cache hits are answered
+        directly; the misses share a single batched embedding + FAISS
+        search, and their LLM calls run concurrently instead of serially.
         """
+        results = [None] * len(queries)
+        misses = []
+        for i, query in enumerate(queries):
+            cache_key = query.strip().lower()
+            cached = self._analysis_cache.get(cache_key)
+            if cached is not None:
+                self._analysis_cache.move_to_end(cache_key)
+                results[i] = cached
+            else:
+                misses.append(i)
+
+        if misses:
+            batched_docs = self.vector_store.search_batch(
+                [queries[i] for i in misses], top_k=5
+            )
+            analyses = await asyncio.gather(*(
+                self._analyze_retrieved(queries[i], docs)
+                for i, docs in zip(misses, batched_docs)
+            ))
+            for i, result in zip(misses, analyses):
+                results[i] = result
+                self._cache_result(queries[i].strip().lower(), result)
+        return results
+
+    async def _analyze_uncached(self, query: str) -> Dict:
+        # Step 1: Retrieve relevant documents
         try:
-            # Step 1: Retrieve relevant documents
             retrieved_docs = self.vector_store.search(query, top_k=5)
-            
+        except Exception as e:
+            logger.error(f"Pipeline error: {e}")
+            return self._fallback_response(str(e))
+        return await self._analyze_retrieved(query, retrieved_docs)
+
+    async def _analyze_retrieved(self, query: str, retrieved_docs: List) -> Dict:
+        """Run the reasoning steps over an already-retrieved document set"""
+        try:
             # Check if we have relevant documents (similarity threshold)
-            relevant_docs = [doc for doc in retrieved_docs if doc.get('similarity_score', 0) > 0.3]
+            relevant_docs = [doc for doc in retrieved_docs if doc.score > 0.3]
             has_relevant_data = len(relevant_docs) >= 1
             
             if has_relevant_data:
-                # Use RAG with retrieved documents
-                context_analysis = self._analyze_context(query, relevant_docs)
-                clinical_analysis = self._analyze_clinical(query, relevant_docs, context_analysis)
-                market_analysis = self._analyze_market(query, relevant_docs, context_analysis)
-                final_decision = self._synthesize_decision(query, context_analysis, clinical_analysis, market_analysis)
-                
+                # Use RAG with retrieved documents - one fused LLM call covers
+                # context, clinical, market and synthesis
+                context_analysis, clinical_analysis, market_analysis, final_decision = \
+                    await self._analyze_all(query, relevant_docs)
+
                 return self._format_response(
                     query, relevant_docs, context_analysis, 
                     clinical_analysis, market_analysis, final_decision,
@@ -58,13 +135,13 @@ class RAGPipeline:
             else:
                 # No relevant data - use OpenAI general knowledge with low confidence
                 logger.info(f"No relevant documents found for query: {query[:50]}. Using general knowledge.")
-                return self._generate_general_insights(query)
+                return await self._generate_general_insights(query)
             
         except Exception as e:
             logger.error(f"Pipeline error: {e}")
             return self._fallback_response(str(e))
     
-    def _generate_general_insights(self, query: str) -> Dict:
+    async def _generate_general_insights(self, query: str) -> Dict:
         """Generate insights using OpenAI's general knowledge when no relevant docs exist"""
         prompt = f"""You are a pharmaceutical research assistant. The user is asking about a topic 
 that is NOT in our internal knowledge base. Provide helpful general insights based on your training data.
@@ -81,7 +158,7 @@ Be clear that this is based on general knowledge, not proprietary data.
 Format your response clearly with sections."""
 
         try:
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model="gpt-3.5-turbo",
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.4
@@ -129,102 +206,77 @@ Please upload relevant documents or consult domain experts for higher confidence
             logger.error(f"General insights generation failed: {e}")
             return self._fallback_response(str(e))
     
-    def _analyze_context(self, query: str, docs: List[Dict]) -> Dict:
-        """Step 1: Context Understanding"""
-        context = "\n".join([f"Doc {i+1}: {doc['content'][:500]}" for i, doc in enumerate(docs)])
-        
-        prompt = self.prompts.context_analysis.format(
-            query=query,
-            retrieved_context=context
-        )
-        
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3
-            )
-            
-            content = response.choices[0].message.content
-            return {"analysis": content, "docs_used": len(docs)}
-            
-        except Exception as e:
-            logger.warning(f"Context analysis failed: {e}")
-            return {"analysis": f"Basic analysis of query: {query}", "docs_used": 0}
-    
-    def _analyze_clinical(self, query: str, docs: List[Dict], context: Dict) -> Dict:
-        """Step 2: Clinical Reasoning"""
-        clinical_docs = [doc for doc in docs if doc.get('type') in ['paper', 'clinical_trial']]
-        doc_content = "\n".join([f"- {doc['content'][:300]}" for doc in clinical_docs])
-        
-        prompt = self.prompts.clinical_analysis.format(
-            query=query,
-            context_understanding=context['analysis'],
-            clinical_evidence=doc_content
-        )
-        
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.2
-            )
-            
-            content = response.choices[0].message.content
-            return {"analysis": content, "evidence_count": len(clinical_docs)}
-            
-        except Exception as e:
-            logger.warning(f"Clinical analysis failed: {e}")
-            return {"analysis": "Clinical analysis unavailable", "evidence_count": 0}
-    
-    def _analyze_market(self, query: str, docs: List[Dict], context: Dict) -> Dict:
-        """Step 3: Market Intelligence"""
-        market_docs = [doc for doc in docs if doc.get('type') == 'market']
-        doc_content = "\n".join([f"- {doc['content'][:300]}" for doc in market_docs])
-        
-        prompt = self.prompts.market_analysis.format(
+    def _split_docs_by_type(self, docs: List[Dict]):
+        """
+        Partition search hits into clinical and market evidence using the
+        vector store's columnar type array (one vectorized mask per category)
+        """
+        ids = [doc.doc_id for doc in docs]
+        types = self.vector_store.doc_types
+        if ids and all(i < len(types) for i in ids):
+            hit_types = types[np.asarray(ids)]
+            clinical_mask = np.isin(hit_types, ('paper', 'clinical_trial'))
+            market_mask = hit_types == 'market'
+            clinical_docs = [doc for doc, m in zip(docs, clinical_mask) if m]
+            market_docs = [doc for doc, m in zip(docs, market_mask) if m]
+        else:
+            # Mismatched ids (e.g. stale columns): scan the hit views directly
+            clinical_docs = [doc for doc in docs if doc.type in ('paper', 'clinical_trial')]
+            market_docs = [doc for doc in docs if doc.type == 'market']
+        return clinical_docs, market_docs
+
+    @staticmethod
+    def _build_doc_context(docs: List[Dict], limit: int, numbered: bool = False) -> str:
+        """
+        Concatenate doc excerpts into one buffer. Writing into a StringIO
+        avoids materializing a list of N formatted strings just to join them.
+        """
+        buf = io.StringIO()
+        for i, doc in enumerate(docs):
+            buf.write(f"Doc {i+1}: " if numbered else "- ")
+            buf.write(doc.content[:limit])
+            buf.write("\n")
+        return buf.getvalue()
+
+    async def _analyze_all(self, query: str, docs: List[Dict]):
+        """
+        Steps 1-4 fused: context, clinical, market and synthesis in a single
+        structured-output LLM call instead of four sequential round-trips
+        """
+        clinical_docs, market_docs = self._split_docs_by_type(docs)
+
+        prompt = self.prompts.combined_analysis.format(
             query=query,
-            context_understanding=context['analysis'],
-            market_intelligence=doc_content
+            retrieved_context=self._build_doc_context(docs, 500, numbered=True),
+            clinical_evidence=self._build_doc_context(clinical_docs, 300),
+            market_intelligence=self._build_doc_context(market_docs, 300)
         )
-        
+
         try:
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model="gpt-3.5-turbo",
                 messages=[{"role": "user", "content": prompt}],
-                temperature=0.2
+                temperature=0.2,
+                response_format={"type": "json_object"}
             )
-            
-            content = response.choices[0].message.content
-            return {"analysis": content, "market_docs": len(market_docs)}
-            
+
+            sections = json.loads(response.choices[0].message.content)
+            context = {"analysis": sections.get("context", ""), "docs_used": len(docs)}
+            clinical = {"analysis": sections.get("clinical", ""), "evidence_count": len(clinical_docs)}
+            market = {"analysis": sections.get("market", ""), "market_docs": len(market_docs)}
+            decision = {"synthesis": sections.get("synthesis", "")}
+            return context, clinical, market, decision
+
         except Exception as e:
-            logger.warning(f"Market analysis failed: {e}")
-            return {"analysis": "Market analysis unavailable", "market_docs": 0}
-    
-    def _synthesize_decision(self, query: str, context: Dict, clinical: Dict, market: Dict) -> Dict:
-        """Step 4: Decision Synthesis"""
-        prompt = self.prompts.decision_synthesis.format(
-            query=query,
-            context_analysis=context['analysis'],
-            clinical_analysis=clinical['analysis'],
-            market_analysis=market['analysis']
-        )
-        
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.1
+            logger.warning(f"Combined analysis failed: {e}")
+            return (
+                {"analysis": f"Basic analysis of query: {query}", "docs_used": 0},
+                {"analysis": "Clinical analysis unavailable", "evidence_count": 0},
+                {"analysis": "Market analysis unavailable", "market_docs": 0},
+                {"synthesis": "Decision synthesis unavailable"}
             )
-            
-            content = response.choices[0].message.content
-            return {"synthesis": content}
-            
-        except Exception as e:
-            logger.warning(f"Decision synthesis failed: {e}")
-            return {"synthesis": "Decision synthesis unavailable"}
-    
+
+
     def _format_response(self, query: str, docs: List[Dict], context: Dict, 
                         clinical: Dict, market: Dict, decision: Dict,
                         from_knowledge_base: bool = True) -> Dict:
@@ -235,29 +287,33 @@ Please upload relevant documents or consult domain experts for higher confidence
         market_text = market.get('analysis', '')
         decision_text = decision.get('synthesis', '')
         
+        # One scan over each text yields every keyword category at once
+        clinical_flags = scan_categories(fold(clinical_text))
+        market_flags = scan_categories(fold(market_text))
+
         # Determine viability
         viability = "Medium"
-        if any(word in clinical_text.lower() for word in ['promising', 'effective', 'successful']):
+        if 'viability_pos' in clinical_flags:
             viability = "High"
-        elif any(word in clinical_text.lower() for word in ['failed', 'ineffective', 'toxic']):
+        elif 'viability_neg' in clinical_flags:
             viability = "Low"
-        
+
         # Extract risks
         risks = []
-        if 'toxicity' in clinical_text.lower():
+        if 'risk_toxicity' in clinical_flags:
             risks.append('toxicity concerns')
-        if 'side effect' in clinical_text.lower():
+        if 'risk_side_effect' in clinical_flags:
             risks.append('adverse effects')
-        if 'trial' in clinical_text.lower() and 'fail' in clinical_text.lower():
+        if 'risk_trial' in clinical_flags and 'risk_fail' in clinical_flags:
             risks.append('trial failure history')
         if not risks:
             risks = ['standard development risks']
-        
+
         # Market signal
         market_signal = "Moderate"
-        if any(word in market_text.lower() for word in ['strong', 'growing', 'demand']):
+        if 'market_strong' in market_flags:
             market_signal = "Strong"
-        elif any(word in market_text.lower() for word in ['weak', 'declining', 'saturated']):
+        elif 'market_weak' in market_flags:
             market_signal = "Weak"
         
         # Recommendation
@@ -280,14 +336,14 @@ Please upload relevant documents or consult domain experts for higher confidence
             if evidence_count >= 2:
                 confidence += 0.2
             # Check average similarity score
-            avg_similarity = sum(doc.get('similarity_score', 0) for doc in docs) / max(len(docs), 1)
+            avg_similarity = sum(doc.score for doc in docs) / max(len(docs), 1)
             if avg_similarity > 0.5:
                 confidence += 0.1
         
         confidence = min(confidence, 1.0)
         
         # Evidence files
-        evidence_files = [doc.get('filename', f'doc_{i}') for i, doc in enumerate(docs[:3])]
+        evidence_files = [doc.filename or f'doc_{i}' for i, doc in enumerate(docs[:3])]
         
         # Add confidence indicator to explanation
         confidence_label = "HIGH" if confidence >= 0.7 else "MEDIUM" if confidence >= 0.5 else "LOW"
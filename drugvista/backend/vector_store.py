@@ -4,45 +4,209 @@ AWS Mapping: This would use SageMaker for embeddings + S3 for document storage
 """
 import os
 import json
+import hashlib
 import pickle
+import threading
 import numpy as np
-from typing import List, Dict
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import Dict, Iterable, List
 import faiss
+from contextlib import nullcontext
+from dataclasses import dataclass
+from pathlib import Path
+from keywords import ANALYSIS_SCANNER, fold
 from sentence_transformers import SentenceTransformer
 import logging
 
+# Pin PyTorch to physical cores with a single interop pool: hyperthread
+# siblings and nested parallelism both thrash MiniLM's small GEMMs
+try:
+    import torch
+    torch.set_num_interop_threads(1)
+    torch.set_num_threads(max(1, (os.cpu_count() or 2) // 2))
+except ImportError:
+    torch = None
+except RuntimeError:
+    pass  # thread pools already started by an earlier importer
+
 logger = logging.getLogger(__name__)
 
+# Per-thread scratch space (query matrices) so concurrent requests do not
+# share buffers and single requests do not re-allocate them
+_TLS = threading.local()
+
+
+def _inference_ctx():
+    """Disable autograd tracking around encode calls when torch is present"""
+    return torch.inference_mode() if torch is not None else nullcontext()
+
+
+@dataclass(slots=True)
+class Hit:
+    """
+    Search result view. References the stored metadata dict instead of
+    copying it per hit, so a search allocates one small object per result
+    rather than a full dict.
+    """
+    score: float
+    doc_id: int
+    doc: dict
+    content: str
+
+    @property
+    def filename(self):
+        return self.doc.get('filename')
+
+    @property
+    def type(self):
+        return self.doc.get('type')
+
+# FAISS index tuning (AWS: these would be OpenSearch/managed vector DB settings)
+# FAISS_INDEX_FACTORY overrides the index type entirely, e.g. "OPQ32,IVF1024,PQ32x8"
+# for large corpora. Defaults to a flat index which needs no training.
+FAISS_INDEX_FACTORY = os.getenv("FAISS_INDEX_FACTORY", "")
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+
+# Storage format for the default (non-factory) index:
+#   flat   - FP32 vectors, exact search
+#   sq8    - int8 scalar quantization: 4x less memory traffic on the scan,
+#            negligible recall loss for normalized MiniLM vectors
+#   sqfp16 - FP16 storage: half the scan bandwidth of flat at essentially
+#            full recall; FAISS decodes FP16 with AVX2 inside the kernel
+#            (combine either with IVF via FAISS_INDEX_FACTORY="IVF256,SQ8"
+#            or "IVF256,SQfp16" at scale)
+INDEX_TYPE = os.getenv("DRUGVISTA_INDEX", "flat")
+
+# A flat index is exact but scans every vector; once the corpus passes this
+# size it is rebuilt as IVF+PQ (see _maybe_upgrade_index). IVF needs roughly
+# 39 training vectors per centroid, so the threshold is also floored at that.
+IVF_AUTO_THRESHOLD = int(os.getenv("FAISS_IVF_THRESHOLD", "10000"))
+IVF_NLIST = 256
+AUTO_FACTORY = f"IVF{IVF_NLIST},PQ48x8"
+
+# Outer ingest chunk: how many documents are pulled from the stream and
+# embedded/indexed together (bounds peak memory for streamed uploads)
+EMBED_BATCH = int(os.getenv("EMBED_BATCH", "1024"))
+
+# encode() micro-batch: 64 fills MiniLM's GEMM tiles on CPU without the
+# padding waste and memory spikes of giant batches
+MODEL_BATCH = int(os.getenv("MODEL_BATCH", "64"))
+
+# Store files resolve against this module's directory, not the CWD, so the
+# demo and scripts can construct a VectorStore from anywhere
+_BASE_DIR = Path(__file__).resolve().parent
+
+# On-disk embedding cache so unchanged chunks skip the transformer forward pass
+EMB_CACHE_DIR = os.getenv("EMB_CACHE_DIR", str(_BASE_DIR / ".emb_cache"))
+
+# Append-only raw float32 copy of every indexed vector: each ingest appends
+# O(new) bytes, and the FAISS index can be rebuilt from it without
+# re-encoding if the index file is lost
+EMB_SIDECAR = os.getenv("EMB_SIDECAR", str(_BASE_DIR / "embeddings.f32"))
+
+# Memory-map the index on load so uvicorn workers share OS page-cache pages
+# instead of each holding a private copy. Set to "0" for the eager read.
+MMAP_INDEX = os.getenv("DRUGVISTA_MMAP_INDEX", "1") != "0"
+
+# Offload search to the first CUDA GPU when the faiss build supports it
+USE_GPU = os.getenv("DRUGVISTA_GPU", "1") != "0"
+
+# Query embeddings kept in memory so repeated queries skip the model
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "4096"))
+
+# Near-duplicate query cache: reuse a recent result list when the cosine
+# similarity between queries reaches tau. Values >= 1 disable the reuse.
+SEMANTIC_CACHE_TAU = float(os.getenv("SEMANTIC_CACHE_TAU", "0.9"))
+SEMANTIC_CACHE_SIZE = 64
+
 class VectorStore:
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2",
+                 encode_batch_size: int = MODEL_BATCH,
+                 index_path: str = None, metadata_path: str = None,
+                 semantic_tau: float = SEMANTIC_CACHE_TAU):
         """
         Initialize vector store
         AWS Mapping: SageMaker endpoint for embeddings
         """
         self.model_name = model_name
-        self.embedding_model = SentenceTransformer(model_name)
+        self.encode_batch_size = encode_batch_size
+        self.index_path = str(index_path or _BASE_DIR / "vector_index.faiss")
+        self.metadata_path = str(metadata_path or _BASE_DIR / "vector_metadata.pkl")
+        self.embedding_model = self._load_encoder(model_name)
         self.dimension = 384  # all-MiniLM-L6-v2 dimension
+
+        # LRU of query embeddings: repeated queries skip the model entirely
+        self._query_cache = OrderedDict()
+
+        # Ring of recently served (embedding, top_k, results): near-duplicate
+        # queries short-circuit the FAISS search entirely
+        self.semantic_tau = semantic_tau
+        self._sem_cache = deque(maxlen=SEMANTIC_CACHE_SIZE)
+
+        # Serializes FAISS access: background ingests run in worker threads,
+        # and index.add/search/write_index release the GIL, so an add that
+        # reallocates index storage must never overlap a search or a save
+        self._index_lock = threading.Lock()
         
         # FAISS index (AWS: would be managed vector DB)
         self.index = None
+        self._mmapped = False
+        self._dirty = False
+        self._gpu_res = None
+        self._on_gpu = False
+        self._ntotal = 0  # cached index.ntotal, avoids a SWIG call per search
+        self.generation = 0  # bumped on ingest; lets callers invalidate caches
+
+        # Columnar (SoA) views of the metadata: type filters over search hits
+        # become vectorized numpy masks instead of per-dict scans
+        self.doc_types = np.empty(0, dtype=object)
+        self.doc_filenames = np.empty(0, dtype=object)
+        # Packed keyword flags per document, computed once at ingest so
+        # analyses test bits instead of re-scanning document text
+        self.doc_flags = np.empty(0, dtype=np.uint32)
         self.documents = []
         self.metadata = []
         
         # Load existing index if available
         self._load_index()
+        self._maybe_offload_gpu()
     
+    def _load_encoder(self, model_name: str):
+        """
+        Load the embedding encoder, preferring the ONNX Runtime path.
+        Set DRUGVISTA_USE_ONNX=0 to force the plain SentenceTransformer.
+        """
+        if os.getenv("DRUGVISTA_USE_ONNX", "1") != "0":
+            try:
+                from onnx_encoder import OnnxEncoder
+                return OnnxEncoder(model_name)
+            except Exception as e:
+                logger.info(f"ONNX encoder unavailable ({e}), using SentenceTransformer")
+        return SentenceTransformer(model_name)
+
     def _load_index(self):
         """Load pre-built index and metadata"""
-        index_path = "vector_index.faiss"
-        metadata_path = "vector_metadata.pkl"
+        index_path = self.index_path
+        metadata_path = self.metadata_path
         
-        if os.path.exists(index_path) and os.path.exists(metadata_path):
+        if os.path.exists(metadata_path) and (
+                os.path.exists(index_path) or os.path.exists(EMB_SIDECAR)):
             try:
-                self.index = faiss.read_index(index_path)
                 with open(metadata_path, 'rb') as f:
                     data = pickle.load(f)
                     self.documents = data['documents']
                     self.metadata = data['metadata']
+                    self.doc_flags = data.get('doc_flags')
+                if self.doc_flags is None or len(self.doc_flags) != len(self.documents):
+                    self._recompute_flags()
+                if os.path.exists(index_path):
+                    self.index = self._read_index_file(index_path)
+                else:
+                    self.index = self._index_from_sidecar(len(self.documents))
+                self._rebuild_columns()
+                self._configure_search_params()
+                self._ntotal = self.index.ntotal
                 logger.info(f"Loaded index with {len(self.documents)} documents")
             except Exception as e:
                 logger.warning(f"Failed to load index: {e}")
@@ -51,71 +215,408 @@ class VectorStore:
             logger.info("No existing index found")
             self._create_empty_index()
     
+    def _read_index_file(self, index_path: str):
+        """Read the FAISS index, memory-mapped when possible"""
+        self._mmapped = False
+        if MMAP_INDEX:
+            try:
+                index = faiss.read_index(
+                    index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+                )
+                self._mmapped = True
+                return index
+            except Exception as e:
+                # Not every index type supports mmap; fall back to eager read
+                logger.info(f"mmap load not supported for this index ({e})")
+        return faiss.read_index(index_path)
+
+    def _index_from_sidecar(self, count: int):
+        """Rebuild a flat index from the append-only embedding sidecar"""
+        vectors = np.memmap(EMB_SIDECAR, dtype=np.float32, mode='r')
+        if vectors.size < count * self.dimension:
+            raise ValueError("embedding sidecar shorter than metadata")
+        vectors = vectors[:count * self.dimension].reshape(count, self.dimension)
+        index = faiss.IndexFlatIP(self.dimension)
+        index.add(np.ascontiguousarray(vectors))
+        logger.info(f"Rebuilt index from {EMB_SIDECAR} ({count} vectors)")
+        return index
+
     def _create_empty_index(self):
         """Create empty FAISS index"""
-        self.index = faiss.IndexFlatIP(self.dimension)  # Inner product for cosine similarity
+        if FAISS_INDEX_FACTORY:
+            # Composite index (e.g. IVF+PQ): prunes the search to nprobe cells and
+            # compresses vectors, so queries stop scanning the whole corpus
+            self.index = faiss.index_factory(
+                self.dimension, FAISS_INDEX_FACTORY, faiss.METRIC_INNER_PRODUCT
+            )
+        elif INDEX_TYPE == "sq8":
+            self.index = faiss.IndexScalarQuantizer(
+                self.dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+            )
+        elif INDEX_TYPE == "sqfp16":
+            self.index = faiss.IndexScalarQuantizer(
+                self.dimension, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT
+            )
+        else:
+            self.index = faiss.IndexFlatIP(self.dimension)  # Inner product for cosine similarity
         self.documents = []
         self.metadata = []
+        self.doc_flags = np.empty(0, dtype=np.uint32)
+        self._ntotal = 0
+        self._rebuild_columns()
+        # A fresh store must not append after vectors from a previous life
+        try:
+            os.remove(EMB_SIDECAR)
+        except OSError:
+            pass
+
+    def _recompute_flags(self):
+        """Rebuild the keyword bitsets (older pickles do not carry them)"""
+        self.doc_flags = np.fromiter(
+            (ANALYSIS_SCANNER.bitmask(fold(doc)) for doc in self.documents),
+            dtype=np.uint32, count=len(self.documents)
+        )
+
+    def _rebuild_columns(self):
+        """Refresh the SoA metadata columns from the metadata dicts"""
+        self.doc_types = np.array(
+            [doc.get('type') for doc in self.metadata], dtype=object
+        )
+        self.doc_filenames = np.array(
+            [doc.get('filename') for doc in self.metadata], dtype=object
+        )
+
+    def _configure_search_params(self):
+        """Apply tunable search parameters (no-op for flat indexes)"""
+        if hasattr(self.index, 'nprobe'):
+            self.index.nprobe = FAISS_NPROBE
     
-    def add_documents(self, documents: List[Dict]):
+    def add_documents(self, documents: Iterable[Dict]) -> int:
         """
-        Add documents to vector store
+        Add documents to vector store, consuming them in EMBED_BATCH-sized
+        batches so streamed ingests never materialize the full upload.
+        Returns the number of documents added.
         AWS Mapping: Documents would be stored in S3, embeddings in SageMaker
         """
-        if not documents:
+        total = 0
+        iterator = iter(documents)
+        while True:
+            batch = list(islice(iterator, EMBED_BATCH))
+            if not batch:
+                break
+
+            # Extract text content
+            texts = [doc['content'] for doc in batch]
+
+            # Generate embeddings (cached per chunk, batched for the misses);
+            # kept outside the lock so encoding never stalls searches
+            logger.info(f"Generating embeddings for {len(texts)} documents")
+            embeddings = self._encode_documents(texts)
+
+            with self._index_lock:
+                # A memory-mapped index is read-only; switch to a private copy to add
+                if self._mmapped:
+                    self.index = faiss.read_index(self.index_path)
+                    self._mmapped = False
+                    self._on_gpu = False
+
+                # Train composite indexes (IVF/PQ) once on the corpus before adding
+                if not self.index.is_trained:
+                    logger.info(f"Training index on {len(embeddings)} vectors")
+                    self.index.train(embeddings)
+                    self._configure_search_params()
+
+                # Add to FAISS index and the append-only sidecar
+                self.index.add(embeddings)
+                self._append_sidecar(embeddings)
+
+                # Store documents and metadata (plus the columnar views)
+                self.documents.extend(texts)
+                self.metadata.extend(batch)
+                self.doc_types = np.concatenate([
+                    self.doc_types, np.array([doc.get('type') for doc in batch], dtype=object)
+                ])
+                self.doc_filenames = np.concatenate([
+                    self.doc_filenames, np.array([doc.get('filename') for doc in batch], dtype=object)
+                ])
+                self.doc_flags = np.concatenate([
+                    self.doc_flags,
+                    np.fromiter((ANALYSIS_SCANNER.bitmask(fold(text)) for text in texts),
+                                dtype=np.uint32, count=len(texts))
+                ])
+                # Published last: searches clamp to _ntotal, so rows only become
+                # visible once their metadata is in place
+                self._ntotal = self.index.ntotal
+            total += len(batch)
+
+        if total:
+            with self._index_lock:
+                self.generation += 1
+                self._sem_cache.clear()
+                self._maybe_upgrade_index()
+                self._maybe_offload_gpu()
+            logger.info(f"Added {total} documents to vector store")
+        return total
+
+    def _maybe_offload_gpu(self):
+        """
+        Move the index to GPU when a CUDA-enabled faiss build finds a device.
+        Batched K-selection over HBM-resident vectors dominates the CPU scan,
+        and repeated queries pay no PCIe cost since the index stays on-card.
+        """
+        if not USE_GPU or self._on_gpu or self._mmapped:
             return
-        
-        # Extract text content
-        texts = [doc['content'] for doc in documents]
-        
-        # Generate embeddings
-        logger.info(f"Generating embeddings for {len(texts)} documents")
-        embeddings = self.embedding_model.encode(texts, normalize_embeddings=True)
-        
-        # Add to FAISS index
-        self.index.add(embeddings.astype('float32'))
-        
-        # Store documents and metadata
-        self.documents.extend(texts)
-        self.metadata.extend(documents)
-        
-        logger.info(f"Added {len(documents)} documents to vector store")
+        try:
+            if faiss.get_num_gpus() < 1:
+                return
+            if self._gpu_res is None:
+                self._gpu_res = faiss.StandardGpuResources()
+            options = faiss.GpuClonerOptions()
+            options.useFloat16 = True  # halves HBM traffic for PQ lookup tables
+            self.index = faiss.index_cpu_to_gpu(self._gpu_res, 0, self.index, options)
+            self._on_gpu = True
+            logger.info("FAISS index offloaded to GPU 0")
+        except AttributeError:
+            pass  # faiss-cpu build: no GPU symbols
+        except Exception as e:
+            logger.info(f"GPU offload unavailable: {e}")
+
+    def _append_sidecar(self, embeddings: np.ndarray):
+        """Append new vectors to the raw float32 sidecar (O(new) ingest I/O)"""
+        try:
+            with open(EMB_SIDECAR, 'ab') as f:
+                embeddings.tofile(f)
+        except OSError as e:
+            logger.warning(f"Embedding sidecar append failed: {e}")
+
+    def _maybe_upgrade_index(self):
+        """
+        Rebuild a flat index as IVF+PQ once the corpus is big enough to train
+        one. IVF restricts each query to nprobe of the IVF_NLIST cells and
+        PQ48x8 compresses 1536-byte vectors to 48 bytes, so searches on large
+        corpora stop streaming the whole vector set through memory.
+        """
+        if FAISS_INDEX_FACTORY or INDEX_TYPE != "flat":
+            return  # an explicitly configured index wins
+        if not isinstance(self.index, faiss.IndexFlatIP):
+            return
+        if self.index.ntotal < max(IVF_AUTO_THRESHOLD, 39 * IVF_NLIST):
+            return
+
+        # The flat index doubles as the training buffer
+        vectors = self.index.reconstruct_n(0, self.index.ntotal)
+        upgraded = faiss.index_factory(
+            self.dimension, AUTO_FACTORY, faiss.METRIC_INNER_PRODUCT
+        )
+        logger.info(f"Training {AUTO_FACTORY} on {len(vectors)} vectors")
+        upgraded.train(vectors)
+        upgraded.add(vectors)
+        self.index = upgraded
+        self._configure_search_params()
     
-    def search(self, query: str, top_k: int = 5) -> List[Dict]:
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        """Encode texts in length-sorted batches to minimize padding waste"""
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        with _inference_ctx():
+            sorted_embeddings = np.asarray(self.embedding_model.encode(
+                [texts[i] for i in order],
+                batch_size=self.encode_batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            ), dtype=np.float32)
+        embeddings = np.empty_like(sorted_embeddings)
+        embeddings[order] = sorted_embeddings
+        return embeddings
+
+    def _cache_key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\n{text}".encode('utf-8')).hexdigest()
+
+    def _encode_documents(self, texts: List[str]) -> np.ndarray:
+        """
+        Encode texts, reusing cached embeddings for unchanged chunks.
+        Cached vectors are stored as FP16 .npy files to halve disk usage.
+        """
+        try:
+            os.makedirs(EMB_CACHE_DIR, exist_ok=True)
+        except OSError as e:
+            logger.warning(f"Embedding cache unavailable: {e}")
+            return self._encode_batch(texts)
+
+        embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+        misses = []
+        for i, text in enumerate(texts):
+            path = os.path.join(EMB_CACHE_DIR, self._cache_key(text) + ".npy")
+            try:
+                embeddings[i] = np.load(path).astype(np.float32)
+            except (OSError, ValueError):
+                misses.append(i)
+
+        if misses:
+            fresh = self._encode_batch([texts[i] for i in misses])
+            for j, i in enumerate(misses):
+                embeddings[i] = fresh[j]
+                path = os.path.join(EMB_CACHE_DIR, self._cache_key(texts[i]) + ".npy")
+                try:
+                    np.save(path, fresh[j].astype(np.float16))
+                except OSError as e:
+                    logger.warning(f"Failed to cache embedding: {e}")
+
+        logger.info(f"Embedding cache: {len(texts) - len(misses)} hits, {len(misses)} misses")
+        return embeddings
+
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        Encode queries through the LRU cache, batch-encoding the misses in
+        one model call so tokenizer and matmul overhead is amortized.
+        """
+        embeddings = [None] * len(queries)
+        misses = []
+        for i, query in enumerate(queries):
+            cached = self._query_cache.get(query)
+            if cached is not None:
+                self._query_cache.move_to_end(query)
+                embeddings[i] = cached
+            else:
+                misses.append(i)
+
+        if misses:
+            # ascontiguousarray is a no-op when encode already returns
+            # C-contiguous float32, avoiding a full extra copy per batch
+            with _inference_ctx():
+                fresh = np.ascontiguousarray(self.embedding_model.encode(
+                    [queries[i] for i in misses],
+                    convert_to_numpy=True,
+                    normalize_embeddings=True,
+                    show_progress_bar=False
+                ), dtype=np.float32)
+            for j, i in enumerate(misses):
+                embeddings[i] = fresh[j]
+                self._query_cache[queries[i]] = fresh[j]
+                if len(self._query_cache) > QUERY_CACHE_SIZE:
+                    self._query_cache.popitem(last=False)
+
+        return self._query_matrix(embeddings)
+
+    def _query_matrix(self, embeddings: List[np.ndarray]) -> np.ndarray:
         """
-        Search for similar documents
+        Stack query embeddings into a reusable per-thread buffer instead of
+        allocating a fresh matrix on every search.
         """
-        if self.index.ntotal == 0:
+        n = len(embeddings)
+        buf = getattr(_TLS, 'qbuf', None)
+        if buf is None or buf.shape[0] < n or buf.shape[1] != self.dimension:
+            buf = np.empty((max(n, 8), self.dimension), dtype=np.float32)
+            _TLS.qbuf = buf
+        for i, embedding in enumerate(embeddings):
+            np.copyto(buf[i], embedding)
+        return buf[:n]
+
+    def search(self, query: str, top_k: int = 5) -> List[Hit]:
+        """
+        Search for similar documents. Near-duplicate queries (cosine >= tau
+        against a recently served one) reuse that result list without
+        touching the FAISS index.
+        """
+        if self._ntotal == 0:
             logger.warning("No documents in vector store")
             return []
-        
-        # Generate query embedding
-        query_embedding = self.embedding_model.encode([query], normalize_embeddings=True)
-        
-        # Search FAISS index
-        scores, indices = self.index.search(query_embedding.astype('float32'), min(top_k, self.index.ntotal))
-        
-        # Format results
-        results = []
-        for score, idx in zip(scores[0], indices[0]):
-            if idx < len(self.metadata):
-                result = self.metadata[idx].copy()
-                result['similarity_score'] = float(score)
-                result['content'] = self.documents[idx]
-                results.append(result)
-        
-        logger.info(f"Retrieved {len(results)} documents for query")
+
+        # copy: _encode_queries hands out a slice of the reusable buffer
+        embedding = self._encode_queries([query])[0].copy()
+
+        # Snapshot under the lock: a background ingest clears the deque and
+        # iterating it unlocked would raise mid-mutation
+        with self._index_lock:
+            generation = self.generation
+            entries = list(self._sem_cache)
+
+        cached = self._semantic_lookup(embedding, top_k, entries)
+        if cached is not None:
+            return cached
+
+        results = self._search_embeddings(embedding[None, :], top_k)[0]
+        with self._index_lock:
+            # An ingest may have invalidated the cache while we searched;
+            # don't re-insert pre-ingest results after its clear
+            if self.generation == generation:
+                self._sem_cache.append((embedding, top_k, results))
         return results
+
+    def _semantic_lookup(self, embedding: np.ndarray, top_k: int, entries: list):
+        """Return cached results for a near-duplicate query, if any"""
+        if self.semantic_tau >= 1.0:
+            return None
+        entries = [entry for entry in entries if entry[1] >= top_k]
+        if not entries:
+            return None
+        # One matmul scores the new query against every cached embedding
+        sims = np.matmul(np.stack([entry[0] for entry in entries]), embedding)
+        best = int(np.argmax(sims))
+        if sims[best] >= self.semantic_tau:
+            logger.info(f"Semantic cache hit (cos={sims[best]:.3f})")
+            return entries[best][2][:top_k]
+        return None
+
+    def search_batch(self, queries: List[str], top_k: int = 5) -> List[List[Hit]]:
+        """
+        Search for several queries in one FAISS call. Stacking the query
+        embeddings lets FAISS batch the inner-product matmul across queries
+        instead of paying per-query dispatch overhead.
+        """
+        if not queries:
+            return []
+        if self._ntotal == 0:
+            logger.warning("No documents in vector store")
+            return [[] for _ in queries]
+
+        query_embeddings = self._encode_queries(list(queries))
+        batched = self._search_embeddings(query_embeddings, top_k)
+        logger.info(f"Retrieved results for {len(queries)} queries in one search")
+        return batched
+
+    def _search_embeddings(self, query_embeddings: np.ndarray, top_k: int) -> List[List[Hit]]:
+        """Run the FAISS search and wrap rows as Hit views"""
+        # One FAISS call for the whole batch, serialized against ingests
+        with self._index_lock:
+            scores, indices = self.index.search(query_embeddings, min(top_k, self._ntotal))
+
+        # Format results per query: Hit views share the stored metadata dicts
+        batched = []
+        for row_scores, row_indices in zip(scores, indices):
+            batched.append([
+                Hit(float(score), int(idx), self.metadata[idx], self.documents[idx])
+                for score, idx in zip(row_scores, row_indices)
+                if 0 <= idx < len(self.metadata)
+            ])
+        return batched
     
+    def mark_dirty(self):
+        """Flag unsaved changes; a debounced flush will persist them"""
+        self._dirty = True
+
+    def flush_if_dirty(self):
+        """Persist the index only when there are unsaved changes"""
+        if self._dirty:
+            self.save_index()
+
     def save_index(self):
         """Save index and metadata to disk"""
         try:
-            faiss.write_index(self.index, "vector_index.faiss")
-            with open("vector_metadata.pkl", 'wb') as f:
-                pickle.dump({
-                    'documents': self.documents,
-                    'metadata': self.metadata
-                }, f)
+            # Hold the lock so write_index never walks an index mid-add
+            with self._index_lock:
+                # write_index needs a CPU index; copy back without evicting the GPU one
+                index = faiss.index_gpu_to_cpu(self.index) if self._on_gpu else self.index
+                faiss.write_index(index, self.index_path)
+                with open(self.metadata_path, 'wb') as f:
+                    # Protocol 5 framing (PEP 574) skips the per-object copies the
+                    # default protocol makes on large payloads
+                    pickle.dump({
+                        'documents': self.documents,
+                        'metadata': self.metadata,
+                        'doc_flags': self.doc_flags
+                    }, f, protocol=5)
+                self._dirty = False
             logger.info("Index saved successfully")
         except Exception as e:
             logger.error(f"Failed to save index: {e}")
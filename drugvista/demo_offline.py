@@ -7,27 +7,42 @@ import os
 sys.path.append("backend")
 
 from vector_store import VectorStore
+from keywords import ANALYSIS_SCANNER, fold
+from collections import OrderedDict
+import numpy as np
 import json
 
+# Completed analyses kept per normalized query
+ANALYSIS_CACHE_SIZE = 512
+
 class OfflineRAGPipeline:
     def __init__(self):
         """Initialize offline RAG pipeline"""
-        # Change to backend directory to find the index files
-        original_dir = os.getcwd()
-        try:
-            os.chdir("backend")
-            self.vector_store = VectorStore()
-            os.chdir(original_dir)
-        except:
-            # If already in backend directory
-            self.vector_store = VectorStore()
+        # VectorStore resolves its files against its own module directory,
+        # so no chdir gymnastics are needed here
+        self.vector_store = VectorStore()
         
         stats = self.vector_store.get_stats()
         print(f"✅ Loaded vector store with {stats['total_documents']} documents")
+        
+        # LRU of completed analyses; repeated queries skip encode + search
+        self._analysis_cache = OrderedDict()
+        self._cache_generation = self.vector_store.generation
     
     def analyze(self, query: str) -> dict:
         """Analyze query using retrieved documents and rule-based reasoning"""
         
+        # Drop cached answers once new documents have been ingested
+        if self.vector_store.generation != self._cache_generation:
+            self._analysis_cache.clear()
+            self._cache_generation = self.vector_store.generation
+        
+        cache_key = query.strip().lower()
+        cached = self._analysis_cache.get(cache_key)
+        if cached is not None:
+            self._analysis_cache.move_to_end(cache_key)
+            return cached
+        
         # Step 1: Retrieve relevant documents
         retrieved_docs = self.vector_store.search(query, top_k=5)
         
@@ -37,40 +52,62 @@ class OfflineRAGPipeline:
         # Step 2: Rule-based analysis (simulating LLM reasoning)
         analysis = self._analyze_documents(query, retrieved_docs)
         
+        self._analysis_cache[cache_key] = analysis
+        if len(self._analysis_cache) > ANALYSIS_CACHE_SIZE:
+            self._analysis_cache.popitem(last=False)
+        
         return analysis
     
+    def analyze_batch(self, queries: list) -> list:
+        """Analyze several queries using one batched vector search"""
+        
+        batched_docs = self.vector_store.search_batch(queries, top_k=5)
+        
+        return [
+            self._analyze_documents(query, docs) if docs
+            else self._fallback_response("No relevant documents found")
+            for query, docs in zip(queries, batched_docs)
+        ]
+    
     def _analyze_documents(self, query: str, docs: list) -> dict:
         """Rule-based document analysis"""
         
-        query_lower = query.lower()
-        doc_contents = [doc['content'].lower() for doc in docs]
-        all_content = ' '.join(doc_contents)
+        # Ingest-time bitsets: OR the per-document masks from the store and
+        # test bits, instead of re-scanning document text on every analysis
+        ids = [doc.doc_id for doc in docs]
+        doc_flags = self.vector_store.doc_flags
+        if ids and all(i < len(doc_flags) for i in ids):
+            combined = int(np.bitwise_or.reduce(doc_flags[np.asarray(ids)]))
+            flags = ANALYSIS_SCANNER.categories_from(combined)
+        else:
+            # Hits without doc ids (older pickles): scan the text directly
+            flags = ANALYSIS_SCANNER.scan_many(fold(doc.content) for doc in docs)
         
         # Clinical Viability Assessment
         viability = "Medium"
-        if any(word in all_content for word in ['effective', 'successful', 'promising', 'approved']):
+        if 'viability_pos' in flags:
             viability = "High"
-        elif any(word in all_content for word in ['failed', 'ineffective', 'toxic', 'discontinued']):
+        elif 'viability_neg' in flags:
             viability = "Low"
         
         # Risk Assessment
         risks = []
-        if 'toxicity' in all_content or 'toxic' in all_content:
+        if 'risk_toxicity' in flags:
             risks.append('toxicity concerns')
-        if 'side effect' in all_content or 'adverse' in all_content:
+        if 'risk_side_effect' in flags:
             risks.append('adverse effects')
-        if 'trial' in all_content and 'fail' in all_content:
+        if 'risk_trial' in flags and 'risk_fail' in flags:
             risks.append('clinical trial failures')
-        if 'bleeding' in all_content:
+        if 'risk_bleeding' in flags:
             risks.append('bleeding risk')
         if not risks:
             risks = ['standard development risks']
         
         # Market Signal
         market_signal = "Moderate"
-        if any(word in all_content for word in ['billion', 'growing', 'strong', 'demand']):
+        if 'market_strong' in flags:
             market_signal = "Strong"
-        elif any(word in all_content for word in ['declining', 'weak', 'saturated']):
+        elif 'market_weak' in flags:
             market_signal = "Weak"
         
         # Recommendation Logic
@@ -84,10 +121,10 @@ class OfflineRAGPipeline:
         confidence = min(0.6 + (len(docs) * 0.05), 0.95)
         
         # Evidence files
-        evidence_files = [doc.get('filename', f'doc_{i}') for i, doc in enumerate(docs[:3])]
+        evidence_files = [doc.filename or f'doc_{i}' for i, doc in enumerate(docs[:3])]
         
         # Generate explanation
-        explanation = self._generate_explanation(query, docs, viability, risks, market_signal, recommendation)
+        explanation = self._generate_explanation(query, docs, viability, risks, market_signal, recommendation, confidence)
         
         return {
             "clinical_viability": viability,
@@ -99,10 +136,10 @@ class OfflineRAGPipeline:
             "explanation": explanation
         }
     
-    def _generate_explanation(self, query, docs, viability, risks, market_signal, recommendation):
+    def _generate_explanation(self, query, docs, viability, risks, market_signal, recommendation, confidence):
         """Generate human-readable explanation"""
         
-        doc_types = [doc.get('type', 'unknown') for doc in docs]
+        doc_types = [doc.type or 'unknown' for doc in docs]
         
         explanation = f"""
 **Query Analysis**: {query}
@@ -154,12 +191,13 @@ def demo_queries():
         "Diabetes GLP-1 receptor agonists"
     ]
     
-    for i, query in enumerate(queries, 1):
+    # One batched search embeds and retrieves all five queries together
+    results = pipeline.analyze_batch(queries)
+    
+    for i, (query, result) in enumerate(zip(queries, results), 1):
         print(f"\n🔍 Query {i}: {query}")
         print("-" * 50)
         
-        result = pipeline.analyze(query)
-        
         print(f"Clinical Viability: {result['clinical_viability']}")
         print(f"Market Signal: {result['market_signal']}")
         print(f"Recommendation: {result['recommendation']}")
@@ -5,7 +5,6 @@ Simple, hackathon-friendly UI
 import streamlit as st
 import requests
 import json
-import time
 
 # Page config
 st.set_page_config(
@@ -87,10 +86,22 @@ st.markdown("""
 # Backend URL
 BACKEND_URL = "http://localhost:8001"
 
+@st.cache_resource
+def get_session():
+    """
+    One pooled HTTP session shared across Streamlit reruns. Keep-alive
+    connections skip the TCP handshake every rerun otherwise pays for each
+    of the health/stats/analyze calls.
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8)
+    session.mount("http://", adapter)
+    return session
+
 def check_backend_health():
     """Check if backend is running"""
     try:
-        response = requests.get(f"{BACKEND_URL}/health", timeout=5)
+        response = get_session().get(f"{BACKEND_URL}/health", timeout=5)
         return response.status_code == 200
     except:
         return False
@@ -101,7 +112,7 @@ def upload_patient_data(file, doc_type, description):
         files = {"file": (file.name, file.getvalue(), "text/plain")}
         data = {"doc_type": doc_type, "description": description}
         
-        response = requests.post(
+        response = get_session().post(
             f"{BACKEND_URL}/ingest",
             files=files,
             data=data,
@@ -121,7 +132,7 @@ def upload_patient_data(file, doc_type, description):
 def get_vector_stats():
     """Get vector store statistics"""
     try:
-        response = requests.get(f"{BACKEND_URL}/stats", timeout=5)
+        response = get_session().get(f"{BACKEND_URL}/stats", timeout=5)
         if response.status_code == 200:
             return response.json()
     except:
@@ -131,7 +142,7 @@ def get_vector_stats():
 def submit_text_data(content, doc_type, title):
     """Submit patient data as text"""
     try:
-        response = requests.post(
+        response = get_session().post(
             f"{BACKEND_URL}/ingest-text",
             json={"content": content, "doc_type": doc_type, "title": title},
             timeout=30
@@ -149,7 +160,7 @@ def submit_text_data(content, doc_type, title):
 def call_analyze_api(query):
     """Call the backend analyze endpoint"""
     try:
-        response = requests.post(
+        response = get_session().post(
             f"{BACKEND_URL}/analyze",
             json={"query": query},
             timeout=30
@@ -366,21 +377,10 @@ def main():
             st.error("Please enter a query with at least 3 characters.")
             return
         
-        # Show loading
-        with st.spinner("🔄 Analyzing... This may take 10-30 seconds"):
-            progress_bar = st.progress(0)
-            
-            # Simulate progress
-            for i in range(100):
-                time.sleep(0.1)
-                progress_bar.progress(i + 1)
-            
-            # Call API
+        # Show loading - the spinner runs for exactly as long as the request
+        with st.spinner("🔄 Analyzing..."):
             result, error = call_analyze_api(query.strip())
         
-        # Clear progress bar
-        progress_bar.empty()
-        
         if error:
             st.error(f"Analysis failed: {error}")
         elif result:
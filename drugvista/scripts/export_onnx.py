@@ -0,0 +1,53 @@
+"""
+One-time export of the embedding model to optimized + INT8-quantized ONNX
+AWS Mapping: this would run in the SageMaker model build pipeline
+
+Produces backend/onnx_model/ containing the graph-optimized model, its
+INT8 dynamically-quantized variant and the tokenizer files. OnnxEncoder
+picks up the quantized model automatically when the folder exists; INT8
+GEMM moves 4x fewer weight bytes and uses VNNI instructions on recent
+CPUs, for a 2-4x faster query embedding than FP32.
+
+Usage: python scripts/export_onnx.py [output_dir]
+"""
+import logging
+import os
+import sys
+
+from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTOptimizer, ORTQuantizer
+from optimum.onnxruntime.configuration import AutoQuantizationConfig, OptimizationConfig
+from transformers import AutoTokenizer
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(__file__), "..", "backend", "onnx_model")
+
+
+def export(output_dir: str):
+    """Export, graph-optimize and INT8-quantize the embedding model"""
+    logger.info(f"Exporting {MODEL_NAME} to ONNX")
+    model = ORTModelForFeatureExtraction.from_pretrained(MODEL_NAME, export=True)
+    model.save_pretrained(output_dir)
+
+    logger.info("Applying graph optimizations (fused attention/layernorm)")
+    optimizer = ORTOptimizer.from_pretrained(model)
+    optimizer.optimize(
+        optimization_config=OptimizationConfig(optimization_level=99),
+        save_dir=output_dir
+    )
+
+    logger.info("Quantizing weights to INT8 (dynamic)")
+    quantizer = ORTQuantizer.from_pretrained(output_dir, file_name="model_optimized.onnx")
+    quantizer.quantize(
+        quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False),
+        save_dir=output_dir
+    )
+
+    AutoTokenizer.from_pretrained(MODEL_NAME).save_pretrained(output_dir)
+    logger.info(f"ONNX model written to {output_dir}")
+
+
+if __name__ == "__main__":
+    export(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_OUTPUT)